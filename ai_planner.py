@@ -1,7 +1,28 @@
 import google.generativeai as genai
+import asyncio
+import contextlib
+import contextvars
+import datetime
 import json
+import queue
+import sys
+import threading
+from dataclasses import dataclass, field, replace
+import json_repair
+from aiolimiter import AsyncLimiter
+from google.generativeai.types import generation_types
+from google.api_core.exceptions import (
+    DeadlineExceeded, GoogleAPIError, InvalidArgument, NotFound, PermissionDenied, ResourceExhausted, ServiceUnavailable,
+)
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Callable, List, Optional
+
+try:
+    # orjson accepts str or bytes and parses several times faster than json
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 # Define the expected structured output from Gemini using Pydantic
 class Activity(BaseModel):
@@ -23,49 +44,556 @@ class TripItinerary(BaseModel):
     budget_tips: List[str] = Field(description="List of 3-5 specific budget tips for this destination")
     itinerary: List[DailyPlan] = Field(description="Day by day plan")
 
+# Outline used to split long trips into independent per-day requests
+class DayOutline(BaseModel):
+    day: int = Field(description="Day number")
+    theme: str = Field(description="Theme for the day, e.g., 'Historical Highlights'")
+    area: str = Field(description="Neighbourhood or area the day is centred on")
+
+class TripOutline(BaseModel):
+    destination: str = Field(description="The destination city/country")
+    total_estimated_cost: str = Field(description="Rough total estimated cost for the trip in INR ₹")
+    budget_tips: List[str] = Field(description="List of 3-5 specific budget tips for this destination")
+    days: List[DayOutline] = Field(description="One entry per day, each covering a different area")
+
+# Trips up to this many days are generated in a single request
+SINGLE_SHOT_MAX_DAYS = 3
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# Instructions shared by every request. Served from a Gemini context cache
+# when large enough to be cached, otherwise sent as the system instruction.
+PREAMBLE = """
+You are an expert travel planner specializing in budget travel for college students.
+Prioritize free activities, student discounts, street food, and cheap transport.
+For every activity, you must provide realistic latitude and longitude coordinates.
+Ensure locations for a single day are geographically close to minimize transit time and costs.
+"""
+
+# Trip-specific prompts, filled in with str.format_map
+_CONSTRAINTS_TMPL = """
+    Constraints & Preferences:
+    - Budget Level: {budget}.
+    - Interests: {interests_str}.{notes_str}
+    """
+
+_PROMPT_TMPL = """
+    Create a detailed {days}-day itinerary for {destination}.
+    """ + _CONSTRAINTS_TMPL
+
+_OUTLINE_PROMPT_TMPL = """
+    Outline a {days}-day trip to {destination}, assigning each day a theme and a distinct area.
+    """ + _CONSTRAINTS_TMPL
+
+_DAY_PROMPT_TMPL = """
+    Plan day {day} of a {days}-day trip to {destination}.
+    The theme for this day is "{theme}", centred on {area}.
+    """ + _CONSTRAINTS_TMPL
+
+def _prompt_fields(destination: str, days: int, budget: str, interests: List[str], notes: str) -> dict:
+    return {
+        # Popular destinations recur across requests, interning makes their keys cheap to hash
+        "destination": sys.intern(destination),
+        "days": days,
+        "budget": budget,
+        "interests_str": ", ".join(interests) if interests else "General sightseeing",
+        "notes_str": f"\nAdditional Notes: {notes}" if notes else "",
+    }
+
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+# Gemini rejects explicit caches smaller than this. The preamble is only about
+# 80 tokens, so today every key falls back to sending it as system_instruction;
+# the cache takes over by itself if the preamble ever grows past the minimum.
+CONTEXT_CACHE_MIN_TOKENS = 1024
+
+# API key -> CachedContent, or None where context caching is unavailable (e.g. free tier)
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+# Token count of the preamble, measured once per process
+_PREAMBLE_TOKENS = None
+
+def _needs_context_cache(api_key: str, refresh: bool) -> bool:
+    if refresh or api_key not in _CACHE:
+        return True
+    cached = _CACHE[api_key]
+    return cached is not None and cached.expire_time - datetime.timedelta(minutes=1) < datetime.datetime.now(datetime.timezone.utc)
+
+def _create_context_cache(api_key: str, refresh: bool):
+    global _PREAMBLE_TOKENS
+    with _CACHE_LOCK:
+        # Another thread may have created it while this one waited for the lock
+        if not _needs_context_cache(api_key, refresh):
+            return _CACHE[api_key]
+
+        try:
+            if _PREAMBLE_TOKENS is None:
+                _PREAMBLE_TOKENS = genai.GenerativeModel(MODEL_NAME).count_tokens(PREAMBLE).total_tokens
+            if _PREAMBLE_TOKENS < CONTEXT_CACHE_MIN_TOKENS:
+                print(f"Preamble is {_PREAMBLE_TOKENS} tokens, below the {CONTEXT_CACHE_MIN_TOKENS}-token caching minimum; sending it uncached")
+                cached = None
+            else:
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{MODEL_NAME}",
+                    system_instruction=PREAMBLE,
+                    ttl=CONTEXT_CACHE_TTL,
+                )
+        except (PermissionDenied, InvalidArgument) as e:
+            print(f"Context caching not available for this API key, sending the full prompt: {e}")
+            cached = None
+        except GoogleAPIError as e:
+            # Likely transient (e.g. 429/503): send this request uncached and try again next time
+            print(f"Failed to create context cache, sending the full prompt: {e}")
+            return None
+        _CACHE[api_key] = cached
+        return cached
+
+# (API key, event loop) genai is currently configured for. genai's async
+# client is bound to the loop it was created on, so models are only reused
+# while both stay the same.
+_CONFIGURED_KEY = None
+# Context cache name (None for uncached) -> GenerativeModel
+_MODELS = {}
+
+def _configure(api_key: str):
+    global _CONFIGURED_KEY
+    configured_key = (api_key, asyncio.get_running_loop())
+    if _CONFIGURED_KEY != configured_key:
+        genai.configure(api_key=api_key)
+        _CONFIGURED_KEY = configured_key
+        _MODELS.clear()
+
+async def _get_model(api_key: str, refresh: bool = False) -> genai.GenerativeModel:
+    _configure(api_key)
+    cached = _CACHE.get(api_key)
+    if _needs_context_cache(api_key, refresh):
+        # Cache creation is a blocking call, keep it off the event loop
+        cached = await asyncio.to_thread(_create_context_cache, api_key, refresh)
+    name = cached.name if cached is not None else None
+    if name not in _MODELS:
+        if cached is None:
+            _MODELS[name] = genai.GenerativeModel(MODEL_NAME, system_instruction=PREAMBLE)
+        else:
+            _MODELS[name] = genai.GenerativeModel.from_cached_content(cached)
+    return _MODELS[name]
+
+def _generation_config(schema) -> dict:
+    # Fully normalized (schema converted to protos.Schema), so the client
+    # does no per-call schema work
+    return generation_types.to_generation_config_dict(genai.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+        temperature=0.7,
+    ))
+
+_GENERATION_CONFIGS = {schema: _generation_config(schema) for schema in (TripItinerary, TripOutline, DailyPlan)}
+
+# Limits concurrent Gemini calls made on behalf of a BatchProcessor. A single
+# request can fan out into many calls, so requests alone are not a safe gate.
+_CALL_SLOTS: contextvars.ContextVar[Optional[asyncio.Semaphore]] = contextvars.ContextVar("_CALL_SLOTS", default=None)
+
+# Transient Gemini errors (rate limits, overload, timeouts) are retried with
+# jittered exponential backoff; anything else, e.g. a bad API key, fails at once.
+@retry(
+    stop=stop_after_attempt(4),
+    wait=wait_random_exponential(min=1, max=16),
+    retry=retry_if_exception_type((ResourceExhausted, ServiceUnavailable, DeadlineExceeded)),
+    reraise=True,
+)
+async def _call_model(model: genai.GenerativeModel, prompt: str, schema, on_text: Optional[Callable[[str], None]] = None):
+    # Hold a call slot only for the call itself, not for the backoff between retries
+    slots = _CALL_SLOTS.get()
+    async with slots if slots is not None else contextlib.nullcontext():
+        if on_text is None:
+            return await model.generate_content_async(prompt, generation_config=_GENERATION_CONFIGS[schema])
+        response = await model.generate_content_async(prompt, generation_config=_GENERATION_CONFIGS[schema], stream=True)
+        buffer = ""
+        async for chunk in response:
+            buffer += chunk.text
+            on_text(buffer)
+        return response
+
+async def _generate(api_key: str, prompt: str, schema, on_text: Optional[Callable[[str], None]] = None):
+    """
+    Sends the trip-specific prompt on top of the cached preamble, recreating
+    the context cache once if it has expired server-side. When `on_text` is
+    given the response is streamed and `on_text` receives the accumulated text
+    after every chunk; a retried stream starts over, so it must tolerate that.
+    """
+    model = await _get_model(api_key)
+    try:
+        return await _call_model(model, prompt, schema, on_text)
+    except (NotFound, PermissionDenied):
+        if _CACHE.get(api_key) is None:
+            raise
+        return await _call_model(await _get_model(api_key, refresh=True), prompt, schema, on_text)
+
+class _DayEmitter:
+    """
+    Forwards finished daily plans to `on_day` exactly once each, in day order,
+    however out of order they complete.
+    """
+
+    def __init__(self, on_day: Optional[Callable[[dict], None]]):
+        self.on_day = on_day
+        self.sent = 0
+        self.pending = {}
+
+    def add(self, index: int, daily_plan: dict):
+        if self.on_day is None or index < self.sent:
+            return
+        self.pending.setdefault(index, daily_plan)
+        while self.sent in self.pending:
+            self.on_day(self.pending.pop(self.sent))
+            self.sent += 1
+
+    def add_partial(self, buffer: str):
+        """
+        Emits the days already complete in a partial JSON itinerary. A day is
+        complete once the next one has started.
+        """
+        if self.on_day is None or "}" not in buffer:
+            return
+        partial = json_repair.loads(buffer)
+        days = partial.get("itinerary", []) if isinstance(partial, dict) else []
+        for index, daily_plan in enumerate(days[:-1]):
+            self.add(index, daily_plan)
+
+def _usage(responses) -> dict:
+    """
+    Sums token usage over a set of Gemini responses for cost reporting.
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+    for response in responses:
+        usage["calls"] += 1
+        usage["prompt_tokens"] += response.usage_metadata.prompt_token_count
+        usage["output_tokens"] += response.usage_metadata.candidates_token_count
+        usage["cached_tokens"] += response.usage_metadata.cached_content_token_count
+    return usage
+
+def _usage_report(usage: dict) -> str:
+    return (f"{usage['calls']} Gemini calls, {usage['prompt_tokens']} prompt tokens "
+            f"({usage['cached_tokens']} cached), {usage['output_tokens']} output tokens")
+
 def generate_itinerary(api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str) -> dict:
     """
-    Calls the Gemini API to generate a structured student trip itinerary.
-    Returns a dictionary parsed from the JSON response.
+    Blocking convenience wrapper around `generate_itinerary_async`.
     """
-    genai.configure(api_key=api_key)
-    
-    # We use a standard fast model that supports structured outputs well
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    
-    interests_str = ", ".join(interests) if interests else "General sightseeing"
-    notes_str = f"\nAdditional Notes: {notes}" if notes else ""
-    
-    prompt = f"""
-    You are an expert travel planner specializing in budget travel for college students.
-    Create a detailed {days}-day itinerary for {destination}.
-    
-    Constraints & Preferences:
-    - Budget Level: {budget}. Prioritize free activities, student discounts, street food, and cheap transport.
-    - Interests: {interests_str}.{notes_str}
-    
-    For every activity, you must provide realistic latitude and longitude coordinates. 
-    Ensure locations for a single day are geographically close to minimize transit time and costs.
+    return asyncio.run(generate_itinerary_async(api_key, destination, days, budget, interests, notes))
+
+async def generate_itinerary_async(api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str,
+                                   on_day: Optional[Callable[[dict], None]] = None) -> dict:
     """
-    
-    from google.api_core.exceptions import InvalidArgument
+    Calls the Gemini API to generate a structured student trip itinerary.
+    Returns a dictionary parsed from the JSON response. If `on_day` is given,
+    the response is streamed and each `DailyPlan` dict is passed to it as soon
+    as it has been generated.
+    """
+    prompt = _PROMPT_TMPL.format_map(_prompt_fields(destination, days, budget, interests, notes))
     
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=TripItinerary,
-                temperature=0.7,
-            )
-        )
+        emitter = _DayEmitter(on_day)
+        response = await _generate(api_key, prompt, TripItinerary, on_text=emitter.add_partial if on_day else None)
         
         # The response is guaranteed to be a JSON string matching the Pydantic schema
-        result_dict = json.loads(response.text)
-        return {"status": "success", "data": result_dict}
+        result_dict = _json_loads(response.text)
+        for index, daily_plan in enumerate(result_dict["itinerary"]):
+            emitter.add(index, daily_plan)
+        return {"status": "success", "data": result_dict, "usage": _usage([response])}
         
     except InvalidArgument as e:
         return {"status": "error", "message": "Invalid API Key provided. Please check your Gemini API key."}
     except Exception as e:
         print(f"Failed to parse Gemini response: {e}")
         return {"status": "error", "message": str(e)}
+
+async def generate_itinerary_batched(api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str,
+                                     on_day: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Generates long trips as one short outline request followed by one `DailyPlan`
+    request per day, all issued concurrently, so latency is close to that of a
+    single day instead of the whole trip. Trips of up to SINGLE_SHOT_MAX_DAYS
+    days use the single-shot path. `on_day` receives each finished day in order.
+    """
+    if days <= SINGLE_SHOT_MAX_DAYS:
+        return await generate_itinerary_async(api_key, destination, days, budget, interests, notes, on_day)
+
+    fields = _prompt_fields(destination, days, budget, interests, notes)
+    outline_prompt = _OUTLINE_PROMPT_TMPL.format_map(fields)
+
+    try:
+        outline_response = await _generate(api_key, outline_prompt, TripOutline)
+        outline = _json_loads(outline_response.text)
+        # Index by day number so a short or reordered outline cannot misalign days
+        outline_days = {d["day"]: d for d in outline["days"]}
+
+        day_prompts = []
+        for day in range(1, days + 1):
+            plan = outline_days.get(day, {"theme": "Free exploration", "area": destination})
+            day_prompts.append(_DAY_PROMPT_TMPL.format_map({**fields, "day": day, "theme": plan["theme"], "area": plan["area"]}))
+
+        emitter = _DayEmitter(on_day)
+
+        async def plan_day(index, prompt):
+            response = await _generate(api_key, prompt, DailyPlan)
+            daily_plan = _json_loads(response.text)
+            daily_plan["day"] = index + 1
+            emitter.add(index, daily_plan)
+            return response, daily_plan
+
+        planned = await asyncio.gather(*(plan_day(index, prompt) for index, prompt in enumerate(day_prompts)))
+        day_responses = [response for response, _ in planned]
+        itinerary = [daily_plan for _, daily_plan in planned]
+
+        result_dict = {
+            "destination": outline["destination"],
+            "total_estimated_cost": outline["total_estimated_cost"],
+            "budget_tips": outline["budget_tips"],
+            "itinerary": itinerary,
+        }
+        return {"status": "success", "data": result_dict, "usage": _usage([outline_response, *day_responses])}
+
+    except InvalidArgument as e:
+        return {"status": "error", "message": "Invalid API Key provided. Please check your Gemini API key."}
+    except Exception as e:
+        print(f"Failed to parse Gemini response: {e}")
+        return {"status": "error", "message": str(e)}
+
+# Separates destinations in a multi-city trip. Commas are left alone since
+# they appear within single destinations ("Paris, France").
+DESTINATION_SEPARATOR = ";"
+
+def split_destinations(destination: str) -> List[str]:
+    return [d.strip() for d in destination.split(DESTINATION_SEPARATOR) if d.strip()]
+
+def plan_segments(destination: str, days: int) -> List[tuple]:
+    """
+    Splits a trip into (destination, days) segments, sharing the days as evenly
+    as possible and giving any extra days to the earlier destinations.
+    """
+    destinations = split_destinations(destination) or [destination]
+    base, extra = divmod(days, len(destinations))
+    return [(d, base + (1 if i < extra else 0)) for i, d in enumerate(destinations)]
+
+async def generate_trip_async(api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str,
+                              on_day: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Plans a trip that may cover several destinations separated by
+    DESTINATION_SEPARATOR. Each destination is planned concurrently and the
+    results are merged in order, with days renumbered across the whole trip,
+    so the trip takes about as long as its slowest destination.
+    """
+    segments = plan_segments(destination, days)
+    if len(segments) == 1:
+        return await generate_itinerary_batched(api_key, segments[0][0], days, budget, interests, notes, on_day)
+    if days < len(segments):
+        return {"status": "error", "message": f"Plan at least one day for each of the {len(segments)} destinations."}
+
+    offsets = [0]
+    for _, segment_days in segments[:-1]:
+        offsets.append(offsets[-1] + segment_days)
+
+    def relabel(daily_plan, index, offset, segment_destination):
+        return {**daily_plan, "day": offset + index + 1, "theme": f"{segment_destination}: {daily_plan['theme']}"}
+
+    emitter = _DayEmitter(on_day)
+
+    def segment_on_day(offset, segment_destination):
+        # Segments report their own days in order, so a counter gives each day's position
+        emitted = [0]
+
+        def forward(daily_plan):
+            emitter.add(offset + emitted[0], relabel(daily_plan, emitted[0], offset, segment_destination))
+            emitted[0] += 1
+
+        return forward if on_day else None
+
+    results = await asyncio.gather(*(
+        generate_itinerary_batched(api_key, segment_destination, segment_days, budget, interests, notes,
+                                   segment_on_day(offset, segment_destination))
+        for (segment_destination, segment_days), offset in zip(segments, offsets)
+    ))
+
+    for result in results:
+        if result.get("status") != "success":
+            return result
+
+    itinerary = []
+    budget_tips = []
+    usage = {}
+    for (segment_destination, _), offset, result in zip(segments, offsets, results):
+        data = result["data"]
+        itinerary.extend(relabel(daily_plan, index, offset, segment_destination) for index, daily_plan in enumerate(data["itinerary"]))
+        budget_tips.extend(tip for tip in data["budget_tips"] if tip not in budget_tips)
+        for key, value in result.get("usage", {}).items():
+            usage[key] = usage.get(key, 0) + value
+
+    result_dict = {
+        "destination": " → ".join(result["data"]["destination"] for result in results),
+        "total_estimated_cost": "; ".join(f"{result['data']['destination']}: {result['data']['total_estimated_cost']}" for result in results),
+        "budget_tips": budget_tips,
+        "itinerary": itinerary,
+    }
+    return {"status": "success", "data": result_dict, "usage": usage}
+
+@dataclass
+class ItineraryRequest:
+    api_key: str
+    destination: str
+    days: int
+    budget: str
+    interests: List[str] = field(default_factory=list)
+    notes: str = ""
+    on_day: Optional[Callable[[dict], None]] = field(default=None, compare=False, repr=False)
+
+    @property
+    def expected_calls(self) -> int:
+        """Number of Gemini calls this request will make."""
+        return sum(1 if d <= SINGLE_SHOT_MAX_DAYS else d + 1 for _, d in plan_segments(self.destination, self.days))
+
+class BatchProcessor:
+    """
+    Shared request pool for itinerary generation.
+
+    Requests submitted from any thread (e.g. concurrent Streamlit sessions) are
+    queued onto one background event loop. Up to `max_concurrency` requests are
+    in flight at once, and batching is continuous: whenever one finishes, the
+    next queued request is admitted straight away instead of waiting for the
+    rest of its batch. When the pool is idle, requests arriving within
+    `batch_window` seconds of each other start together. Since long trips fan
+    out into several Gemini calls, the calls themselves are also capped at
+    `max_concurrency`, and a limiter enforces the requests-per-minute quota.
+
+    Requests are binned by trip length, which predicts output size and so
+    generation time. Free slots are handed to the bins in turn, so a 1-day
+    trip is never queued behind a run of 14-day ones.
+    """
+
+    # Upper bound on days for each bin (short, medium, long)
+    BIN_MAX_DAYS = (3, 8, None)
+
+    def __init__(self, max_concurrency: int = 10, rate_limit_rpm: int = 60, batch_window: float = 0.01):
+        self.max_concurrency = max_concurrency
+        self.rate_limit_rpm = rate_limit_rpm
+        self.batch_window = batch_window
+        self._tasks = set()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="itinerary-batch-processor", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self):
+        # asyncio primitives must be created on the loop that uses them
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._call_slots = asyncio.Semaphore(self.max_concurrency)
+        self._limiter = AsyncLimiter(self.rate_limit_rpm, 60)
+        self._bins = [asyncio.Queue() for _ in self.BIN_MAX_DAYS]
+        self._next_bin = 0
+        self._arrived = asyncio.Event()
+        self._spawn(self._dispatch())
+
+    def close(self):
+        """
+        Cancels pending work and stops the background loop.
+        """
+        async def cancel_tasks():
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        # Keep a reference so pending tasks are not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, request: ItineraryRequest) -> dict:
+        """
+        Queues a request and waits for its result. Safe to await from any event loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(request), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def stream(self, request: ItineraryRequest) -> "ItineraryStream":
+        """
+        Queues a request and returns an iterator over its days as they are
+        generated. Blocks the calling thread while iterating.
+        """
+        days = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(replace(request, on_day=days.put)), self._loop)
+        # Runs on the loop thread after every on_day call, so it always arrives last
+        future.add_done_callback(lambda _: days.put(ItineraryStream.END))
+        return ItineraryStream(days, future)
+
+    def _bin_for(self, request: ItineraryRequest) -> asyncio.Queue:
+        for max_days, requests in zip(self.BIN_MAX_DAYS, self._bins):
+            if max_days is None or request.days <= max_days:
+                return requests
+
+    async def _enqueue(self, request: ItineraryRequest) -> dict:
+        result = self._loop.create_future()
+        await self._bin_for(request).put((request, result))
+        self._arrived.set()
+        return await result
+
+    def _next_request(self):
+        """
+        Takes the next request from the bins in round-robin order, or None.
+        """
+        for offset in range(len(self._bins)):
+            index = (self._next_bin + offset) % len(self._bins)
+            if not self._bins[index].empty():
+                self._next_bin = (index + 1) % len(self._bins)
+                return self._bins[index].get_nowait()
+        return None
+
+    async def _dispatch(self):
+        while True:
+            await self._arrived.wait()
+            # Give near-simultaneous requests a moment to join this batch
+            await asyncio.sleep(self.batch_window)
+            self._arrived.clear()
+            # Admit queued requests one at a time as slots free up
+            while any(not requests.empty() for requests in self._bins):
+                await self._semaphore.acquire()
+                self._spawn(self._run(*self._next_request()))
+
+    async def _run(self, request: ItineraryRequest, result: asyncio.Future):
+        # Each task has its own context, and tasks spawned from here inherit it
+        _CALL_SLOTS.set(self._call_slots)
+        try:
+            # Long trips fan out into several calls, so charge the quota for each
+            await self._limiter.acquire(min(request.expected_calls, self._limiter.max_rate))
+            response = await generate_trip_async(**vars(request))
+            if response.get("usage"):
+                print(f"{request.days}-day trip to {request.destination}: {_usage_report(response['usage'])}")
+            result.set_result(response)
+        except Exception as e:
+            result.set_exception(e)
+        finally:
+            self._semaphore.release()
+
+class ItineraryStream:
+    """
+    Iterates over `DailyPlan` dicts as they are generated. Once iteration has
+    finished, `result()` returns the full response dict.
+    """
+
+    END = object()
+
+    def __init__(self, days: queue.Queue, future):
+        self._days = days
+        self._future = future
+
+    def __iter__(self):
+        while (daily_plan := self._days.get()) is not self.END:
+            yield daily_plan
+
+    def result(self) -> dict:
+        return self._future.result()
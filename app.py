@@ -1,10 +1,19 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import folium
-from streamlit_folium import st_folium
+import hashlib
+import html
+import json
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import httpx
+import orjson
+import zstandard as zstd
 import ai_planner
+from cache import LayeredCache
 
 # Load environment variables, overriding any existing ones to ensure .env updates take effect
 load_dotenv(override=True)
@@ -17,6 +26,158 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# --- RESPONSE CACHE ---
+@st.cache_resource
+def get_itinerary_cache() -> LayeredCache:
+    return LayeredCache.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+itinerary_cache = get_itinerary_cache()
+
+# --- REQUEST POOL ---
+# When set, itineraries are planned by the shared backend in server.py instead
+# of an in-process request pool
+ITINERARY_API_URL = os.getenv("ITINERARY_API_URL")
+
+@st.cache_resource
+def get_batch_processor() -> ai_planner.BatchProcessor:
+    return ai_planner.BatchProcessor(max_concurrency=10, rate_limit_rpm=60)
+
+processor = None if ITINERARY_API_URL else get_batch_processor()
+
+class PlanningError(Exception):
+    pass
+
+# Days are streamed as they finish, so the read timeout bounds the wait for the
+# next line rather than for the whole trip
+SERVER_TIMEOUT = httpx.Timeout(10.0, read=120.0)
+
+def request_from_server(trip_request: dict, on_day=None) -> dict:
+    """
+    Plans a trip on the backend, passing each day to `on_day` as it streams in.
+    """
+    result = None
+    try:
+        with httpx.stream("POST", f"{ITINERARY_API_URL}/itinerary", json=trip_request, timeout=SERVER_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if "day" in message:
+                    if on_day:
+                        on_day(message["day"])
+                else:
+                    result = message["result"]
+    except httpx.HTTPError as e:
+        raise PlanningError(f"Itinerary service request failed: {e}")
+    except (ValueError, KeyError, TypeError) as e:
+        raise PlanningError(f"Itinerary service sent a malformed response: {e}")
+    return result
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def plan_trip(destination: str, days: int, budget: str, interests: tuple, notes: str,
+              _api_key: str, _destination: str = None, _on_day=None, _fresh: bool = False) -> dict:
+    """
+    In-process (L0) cache over the Redis L1/L2 cache and Gemini. Arguments are
+    expected pre-normalized (see `trip_key`); `_destination` carries the
+    destination as typed, for the prompt. The API key, display casing and
+    callbacks are not part of the key. Failures raise PlanningError so they
+    are never cached.
+    """
+    trip_request = dict(destination=_destination or destination, days=days, budget=budget, interests=list(interests), notes=notes)
+    if not _fresh:
+        cached = itinerary_cache.get(_api_key, **trip_request)
+        if cached is not None:
+            return cached
+    
+    if ITINERARY_API_URL:
+        result = request_from_server(trip_request, _on_day)
+    else:
+        stream = processor.stream(ai_planner.ItineraryRequest(api_key=_api_key, **trip_request))
+        for day in stream:
+            if _on_day:
+                _on_day(day)
+        result = stream.result()
+    
+    if not result or result.get("status") != "success":
+        raise PlanningError(result.get("message", "An unknown error occurred.") if result else "Failed to get a response from the AI planner.")
+    itinerary_cache.set(_api_key, data=result["data"], **trip_request)
+    return result["data"]
+
+def trip_key(destination: str, days: int, budget: str, interests: list, notes: str) -> tuple:
+    """
+    Normalized `plan_trip` key arguments, so trivially different submissions
+    share one L0 entry.
+    """
+    return (destination.strip().lower(), days, budget, tuple(sorted(interests)), notes.strip())
+
+def day_stops(day: dict, day_color: str = None) -> list:
+    """
+    One (day, color, lat, lon, name, time, cost, description) tuple per activity.
+    """
+    return [
+        (day['day'], day_color, act['latitude'], act['longitude'], act['name'], act['time'], act['cost_estimate'], act['description'])
+        for act in day['activities']
+    ]
+
+def day_markdown(day_num: int, theme: str, stops: list) -> str:
+    lines = [f"### Day {day_num}: {theme}"]
+    for _, _, _, _, act_name, act_time, act_cost, act_desc in stops:
+        lines.append(f"**{act_time}** - {act_name} ({act_cost})\n\n*{act_desc}*")
+    return "\n\n".join(lines) + "\n\n---\n\n"
+
+# --- SESSION STATE ---
+# The itinerary is kept in session state as compressed JSON, which is several
+# times smaller than the parsed dict
+def _pack(itinerary_data: dict) -> bytes:
+    return zstd.ZstdCompressor(level=3).compress(orjson.dumps(itinerary_data))
+
+def _unpack(packed: bytes) -> dict:
+    return orjson.loads(zstd.ZstdDecompressor().decompress(packed))
+
+# --- MAP ---
+# Marker color for each day, cycling for long trips
+COLORS = ('red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 'lightgray')
+
+# Folium embeds popups and tooltips in JavaScript template literals, where
+# backticks, `${` and backslashes are live even after HTML escaping
+_TEMPLATE_LITERAL_ESCAPES = str.maketrans({"`": "&#96;", "$": "&#36;", "\\": "&#92;"})
+
+def map_text(text: str) -> str:
+    """
+    Escapes model-generated text for a map popup or tooltip.
+    """
+    return html.escape(text).translate(_TEMPLATE_LITERAL_ESCAPES)
+
+def itinerary_hash(packed_itinerary: bytes) -> str:
+    return hashlib.md5(packed_itinerary).hexdigest()
+
+@st.cache_resource(max_entries=32)
+def build_map(itinerary_key: str, _stops: list) -> folium.Map:
+    """
+    Builds the trip map once per itinerary; `itinerary_key` identifies the
+    itinerary, so the stops themselves are not hashed on every rerun.
+    """
+    coords = np.array([(act_lat, act_lon) for _, _, act_lat, act_lon, *_ in _stops], dtype=np.float64)
+    
+    # Center map on the first activity
+    m = folium.Map(location=coords[0].tolist(), zoom_start=12)
+    
+    # Add markers for each activity
+    for day_num, day_color, act_lat, act_lon, act_name, act_time, act_cost, _ in _stops:
+        folium.Marker(
+            [act_lat, act_lon],
+            # Names and costs come from the model and may be shared through the cache
+            popup=f"<b>{map_text(act_name)}</b><br>Day {day_num}: {map_text(act_time)}<br>Cost: {map_text(act_cost)}",
+            tooltip=f"Day {day_num}: {map_text(act_name)}",
+            icon=folium.Icon(color=day_color, icon='info-sign')
+        ).add_to(m)
+    
+    # Fit bounds to show all markers; only the two corners are sent to the browser
+    sw, ne = coords.min(0).tolist(), coords.max(0).tolist()
+    m.fit_bounds([sw, ne])
+    return m
+
 # --- CUSTOM CSS ---
 st.markdown("""
 <style>
@@ -62,7 +223,11 @@ with st.sidebar:
     st.divider()
     
     # Trip Inputs
-    destination = st.text_input("Destination (City/Country)", placeholder="e.g., Paris, France")
+    destination = st.text_input(
+        "Destination (City/Country)",
+        placeholder="e.g., Paris, France",
+        help=f"Separate several destinations with '{ai_planner.DESTINATION_SEPARATOR}' to plan a multi-city trip",
+    )
     
     col1, col2 = st.columns(2)
     with col1:
@@ -81,6 +246,7 @@ with st.sidebar:
     st.divider()
     
     generate_btn = st.button("🚀 Generate Itinerary", use_container_width=True)
+    regenerate_btn = st.button("🔄 Regenerate", use_container_width=True, help="Ignore cached itineraries and plan again")
 
 # --- STATE INITIALIZATION ---
 if "itinerary_data" not in st.session_state:
@@ -88,7 +254,7 @@ if "itinerary_data" not in st.session_state:
 if "error_message" not in st.session_state:
     st.session_state.error_message = None
 
-if generate_btn:
+if generate_btn or regenerate_btn:
     # Reset state on new generation
     st.session_state.itinerary_data = None
     st.session_state.error_message = None
@@ -97,23 +263,41 @@ if generate_btn:
         st.error("Please provide a Gemini API Key in the sidebar or `.env` file to proceed.")
     elif not destination:
         st.warning("Please enter a destination.")
+    elif len(ai_planner.split_destinations(destination)) > duration_days:
+        st.warning("Please allow at least one day for each destination.")
     else:
-        with st.spinner("✨ Gemini is planning your perfect trip..."):
-            result = ai_planner.generate_itinerary(
-                api_key=api_key,
-                destination=destination,
-                days=duration_days,
-                budget=budget_level,
-                interests=interests,
-                notes=additional_notes
+        key = trip_key(destination, duration_days, budget_level, interests, additional_notes)
+        if regenerate_btn:
+            # Drop only this request's entry, other users keep theirs
+            plan_trip.clear(*key)
+        
+        # Show each day as soon as Gemini has finished writing it. The plan runs
+        # on a worker thread so this thread is free to update the placeholder.
+        placeholder = st.empty()
+        placeholder.info("✨ Gemini is planning your perfect trip...")
+        days_done = queue.Queue()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(
+                plan_trip,
+                *key,
+                _api_key=api_key,
+                _destination=destination.strip(),
+                _on_day=days_done.put,
+                _fresh=regenerate_btn,
             )
-            
-        if result and result.get("status") == "success":
-            st.session_state.itinerary_data = result["data"]
+            future.add_done_callback(lambda _: days_done.put(None))
+            preview = ""
+            while (day := days_done.get()) is not None:
+                preview += day_markdown(day['day'], day['theme'], day_stops(day))
+                placeholder.markdown(preview)
+        placeholder.empty()
+        
+        try:
+            st.session_state.itinerary_data = _pack(future.result())
             st.session_state.error_message = None
-        else:
+        except PlanningError as e:
             st.session_state.itinerary_data = None
-            st.session_state.error_message = result.get("message", "An unknown error occurred.") if result else "Failed to get a response from the AI planner."
+            st.session_state.error_message = str(e)
 
 # --- MAIN UI ---
 st.markdown('<h1 class="main-title">AI Travel Planner for Students</h1>', unsafe_allow_html=True)
@@ -123,7 +307,7 @@ st.markdown('<p class="sub-title">Personalized, budget-friendly itineraries powe
 if st.session_state.error_message:
     st.error(f"Failed to generate itinerary: {st.session_state.error_message}")
 elif st.session_state.itinerary_data:
-    itinerary_data = st.session_state.itinerary_data
+    itinerary_data = _unpack(st.session_state.itinerary_data)
     # Display Trip Overview
     st.success(f"Trip to {itinerary_data['destination']} planned successfully!")
     st.markdown(f"**Estimated Total Cost:** {itinerary_data['total_estimated_cost']}")
@@ -134,35 +318,28 @@ elif st.session_state.itinerary_data:
     
     st.divider()
     
+    day_colors = {d['day']: COLORS[(d['day'] - 1) % len(COLORS)] for d in itinerary_data['itinerary']}
+    
+    # Walk the itinerary once, collecting every stop for the map and each day's text
+    stops = []
+    day_sections = []
+    for day in itinerary_data['itinerary']:
+        stops_today = day_stops(day, day_colors[day['day']])
+        stops.extend(stops_today)
+        day_sections.append(day_markdown(day['day'], day['theme'], stops_today))
+    
     # Map Implementation
     st.subheader("📍 Your Trip Highlights")
             
-    # Gather all coordinates to calculate map bounds
-    all_coords = []
-    for day in itinerary_data['itinerary']:
-        for act in day['activities']:
-            all_coords.append([act['latitude'], act['longitude']])
-    
-    if all_coords:
-        # Center map on the first activity
-        m = folium.Map(location=all_coords[0], zoom_start=12)
-        
-        colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 'lightgray']
-        
-        # Add markers for each activity
-        for day in itinerary_data['itinerary']:
-            day_color = colors[(day['day'] - 1) % len(colors)]
-            for act in day['activities']:
-                folium.Marker(
-                    [act['latitude'], act['longitude']],
-                    popup=f"<b>{act['name']}</b><br>Day {day['day']}: {act['time']}<br>Cost: {act['cost_estimate']}",
-                    tooltip=f"Day {day['day']}: {act['name']}",
-                    icon=folium.Icon(color=day_color, icon='info-sign')
-                ).add_to(m)
-        
-        # Fit bounds to show all markers
-        m.fit_bounds(all_coords)
-        st_folium(m, width=900, height=500)
+    if stops:
+        map_key = itinerary_hash(st.session_state.itinerary_data)
+        cached_map = st.session_state.get("map_html")
+        if not cached_map or cached_map[0] != map_key:
+            m = build_map(map_key, stops)
+            st.session_state.map_html = (map_key, m.get_root().render())
+        # The map is display-only, so static HTML is enough; on reruns of the
+        # same itinerary this skips Folium entirely
+        st.iframe(st.session_state.map_html[1], height=500)
     else:
         st.info("No coordinates returned to display on the map.")
         
@@ -170,13 +347,9 @@ elif st.session_state.itinerary_data:
             
     # Itinerary Implementation
     st.subheader("📅 Your Itinerary")
-    for day in itinerary_data['itinerary']:
+    for section in day_sections:
         with st.container():
-            st.markdown(f"### Day {day['day']}: {day['theme']}")
-            for act in day['activities']:
-                st.markdown(f"**{act['time']}** - {act['name']} ({act['cost_estimate']})")
-                st.markdown(f"*{act['description']}*")
-            st.markdown("---")
+            st.markdown(section)
             
 else:
     # Empty State
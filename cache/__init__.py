@@ -0,0 +1,3 @@
+from .layered import LayeredCache, RedisCache, RedisSemanticCache, request_key
+
+__all__ = ["LayeredCache", "RedisCache", "RedisSemanticCache", "request_key"]
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import re
+from array import array
+from functools import lru_cache
+from typing import List, Optional
+
+import google.generativeai as genai
+
+try:
+    import redis
+    from redis.commands.search.field import NumericField, TagField, VectorField
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+    from redis.commands.search.query import Query
+except ImportError:  # Redis is optional: without it every lookup is simply a miss
+    redis = None
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
+
+
+def request_key(destination: str, days: int, budget: str, interests: List[str], notes: str) -> str:
+    """
+    Canonical hash of a trip request, so trivially different submissions
+    (casing, whitespace, interest order) share the same exact-match entry.
+    """
+    canonical = {
+        "destination": destination.lower().strip(),
+        "days": days,
+        "budget": budget,
+        "interests": sorted(interests),
+        "notes": notes.strip(),
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def semantic_text(destination: str, interests: List[str], notes: str) -> str:
+    """Text embedded for the semantic (L2) lookup."""
+    return f"{destination.strip()}|{', '.join(sorted(interests))}|{notes.strip()}"
+
+
+@lru_cache(maxsize=256)
+def _embed(text: str) -> bytes:
+    # genai must already be configured with the caller's API key
+    result = genai.embed_content(model=EMBEDDING_MODEL, content=text)
+    return array("f", result["embedding"]).tobytes()
+
+
+def _tag(value: str) -> str:
+    # Tag values are matched literally, so keep them to word characters
+    return re.sub(r"\W+", "_", value.lower().strip())
+
+
+class RedisCache:
+    """
+    L1: exact-match cache of itinerary JSON keyed on the canonical request hash.
+    """
+
+    def __init__(self, client, ttl: int = 3600, prefix: str = "itinerary:l1:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        payload = self.client.get(self.prefix + key)
+        return json.loads(payload) if payload else None
+
+    def set(self, key: str, data: dict) -> None:
+        self.client.set(self.prefix + key, json.dumps(data), ex=self.ttl)
+
+
+class RedisSemanticCache:
+    """
+    L2: nearest-neighbour cache over request embeddings, stored in a RediSearch
+    HNSW index. Only requests for the same destination, length and budget are
+    compared, so a near-identical request for another city can never match,
+    and a hit requires cosine similarity of at least `threshold`.
+    """
+
+    def __init__(self, client, ttl: int = 7200, threshold: float = 0.92,
+                 index_name: str = "itinerary_l2_v2", prefix: str = "itinerary:l2:v2:"):
+        self.client = client
+        self.ttl = ttl
+        self.threshold = threshold
+        self.index_name = index_name
+        self.prefix = prefix
+        self._index_ready = False
+
+    def _ensure_index(self) -> None:
+        if self._index_ready:
+            return
+        index = self.client.ft(self.index_name)
+        try:
+            index.info()
+        except redis.ResponseError:
+            index.create_index(
+                [
+                    TagField("destination"),
+                    NumericField("days"),
+                    TagField("budget"),
+                    VectorField("embedding", "HNSW", {
+                        "TYPE": "FLOAT32",
+                        "DIM": EMBEDDING_DIM,
+                        "DISTANCE_METRIC": "COSINE",
+                    }),
+                ],
+                definition=IndexDefinition(prefix=[self.prefix], index_type=IndexType.HASH),
+            )
+        self._index_ready = True
+
+    def get(self, embedding: bytes, destination: str, days: int, budget: str) -> Optional[dict]:
+        self._ensure_index()
+        query = (
+            Query(
+                f"(@destination:{{{_tag(destination)}}} @days:[{days} {days}] @budget:{{{_tag(budget)}}})"
+                "=>[KNN 1 @embedding $vec AS distance]"
+            )
+            .return_fields("payload", "distance")
+            .dialect(2)
+        )
+        docs = self.client.ft(self.index_name).search(query, query_params={"vec": embedding}).docs
+        # RediSearch reports cosine distance, i.e. 1 - similarity
+        if docs and 1 - float(docs[0].distance) >= self.threshold:
+            return json.loads(docs[0].payload)
+        return None
+
+    def set(self, key: str, embedding: bytes, destination: str, days: int, budget: str, data: dict) -> None:
+        self._ensure_index()
+        name = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping={
+            "destination": _tag(destination),
+            "days": days,
+            "budget": _tag(budget),
+            "embedding": embedding,
+            "payload": json.dumps(data),
+        })
+        pipe.expire(name, self.ttl)
+        pipe.execute()
+
+
+def _has_search(client) -> bool:
+    try:
+        client.execute_command("FT._LIST")
+    except redis.ResponseError:
+        return False
+    return True
+
+
+class LayeredCache:
+    """
+    Two-tier itinerary cache: L1 exact match, then L2 semantic match.
+    L2 hits are promoted into L1. Any Redis failure degrades to a cache miss.
+    Without `semantic`, e.g. on a Redis server lacking the search module, only
+    L1 is used and no embeddings are computed.
+    """
+
+    def __init__(self, client=None, semantic: bool = True):
+        self.l1 = RedisCache(client) if client is not None else None
+        self.l2 = RedisSemanticCache(client) if client is not None and semantic else None
+
+    @classmethod
+    def from_url(cls, url: str) -> "LayeredCache":
+        if redis is None:
+            return cls()
+        try:
+            client = redis.Redis.from_url(url)
+            client.ping()
+            semantic = _has_search(client)
+        except redis.RedisError as e:
+            print(f"Redis cache unavailable, continuing without it: {e}")
+            return cls()
+        if not semantic:
+            print("Redis search module not available, continuing without the semantic cache")
+        return cls(client, semantic)
+
+    @property
+    def enabled(self) -> bool:
+        return self.l1 is not None
+
+    def get(self, api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        key = request_key(destination, days, budget, interests, notes)
+        try:
+            data = self.l1.get(key)
+            if data is not None or self.l2 is None:
+                return data
+
+            genai.configure(api_key=api_key)
+            embedding = _embed(semantic_text(destination, interests, notes))
+            data = self.l2.get(embedding, destination, days, budget)
+            if data is not None:
+                self.l1.set(key, data)
+            return data
+        except Exception as e:
+            print(f"Itinerary cache lookup failed: {e}")
+            return None
+
+    def set(self, api_key: str, destination: str, days: int, budget: str, interests: List[str], notes: str, data: dict) -> None:
+        if not self.enabled:
+            return
+
+        key = request_key(destination, days, budget, interests, notes)
+        try:
+            self.l1.set(key, data)
+            if self.l2 is None:
+                return
+            genai.configure(api_key=api_key)
+            embedding = _embed(semantic_text(destination, interests, notes))
+            self.l2.set(key, embedding, destination, days, budget, data)
+        except Exception as e:
+            print(f"Failed to store itinerary in cache: {e}")
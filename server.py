@@ -0,0 +1,80 @@
+"""
+Itinerary backend for multi-user deployments.
+
+Holds a single BatchProcessor so requests from every Streamlit session share
+one continuously batched pool of Gemini calls. Run with:
+
+    uvicorn server:app --workers 1 --loop uvloop
+
+and point the front-end at it with ITINERARY_API_URL=http://localhost:8000.
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import List
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+import ai_planner
+
+load_dotenv(override=True)
+
+processor = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global processor
+    processor = ai_planner.BatchProcessor(
+        max_concurrency=int(os.getenv("MAX_CONCURRENCY", "10")),
+        rate_limit_rpm=int(os.getenv("RATE_LIMIT_RPM", "60")),
+    )
+    yield
+    processor.close()
+
+app = FastAPI(title="Student Travel Planner API", lifespan=lifespan)
+
+class ItineraryBody(BaseModel):
+    destination: str
+    days: int = Field(ge=1, le=14)
+    budget: str
+    interests: List[str] = []
+    notes: str = ""
+
+@app.post("/itinerary")
+async def create_itinerary(body: ItineraryBody):
+    """
+    Streams newline-delimited JSON: one {"day": ...} line per finished day,
+    then a final {"result": ...} line with the full response.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY is not configured on the server.")
+
+    loop = asyncio.get_running_loop()
+    days = asyncio.Queue()
+    request = ai_planner.ItineraryRequest(
+        api_key=api_key,
+        # Days are reported from the processor's thread, hand them over to this loop
+        on_day=lambda day: loop.call_soon_threadsafe(days.put_nowait, day),
+        **body.model_dump(),
+    )
+    task = asyncio.ensure_future(processor.submit(request))
+    # Scheduled after every on_day handover, so it always arrives last
+    task.add_done_callback(lambda _: days.put_nowait(None))
+
+    async def lines():
+        while (day := await days.get()) is not None:
+            yield json.dumps({"day": day}) + "\n"
+        yield json.dumps({"result": task.result()}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # "auto" picks uvloop when it is installed
+    uvicorn.run("server:app", workers=1, loop="auto")
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+import ai_planner
+
+
+USAGE = types.SimpleNamespace(prompt_token_count=1, candidates_token_count=1, cached_content_token_count=0)
+
+
+def make_trip(destination, days):
+    return {
+        "destination": destination,
+        "total_estimated_cost": f"₹{days}",
+        "budget_tips": ["Walk everywhere", f"Tip for {destination}"],
+        "itinerary": [{"day": d, "theme": f"Theme {d}", "activities": []} for d in range(1, days + 1)],
+    }
+
+
+class FakeModel:
+    """Stands in for GenerativeModel, recording how many calls overlap."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, generation_config, stream=False):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if "Outline" in prompt:
+            payload = {"destination": "X", "total_estimated_cost": "₹1", "budget_tips": [], "days": []}
+        elif "Plan day" in prompt:
+            payload = {"day": 1, "theme": "Theme", "activities": []}
+        else:
+            payload = make_trip("X", 1)
+        return types.SimpleNamespace(text=json.dumps(payload), usage_metadata=USAGE)
+
+
+@pytest.fixture
+def make_processor():
+    processors = []
+
+    def make(**kwargs):
+        processors.append(ai_planner.BatchProcessor(**kwargs))
+        return processors[-1]
+
+    yield make
+    for processor in processors:
+        processor.close()
+
+
+def submit(processor, request, timeout=5):
+    return asyncio.run(asyncio.wait_for(processor.submit(request), timeout))
+
+
+def test_day_emitter_orders_and_deduplicates():
+    emitted = []
+    emitter = ai_planner._DayEmitter(emitted.append)
+    emitter.add(1, {"day": 2})
+    assert emitted == []
+    emitter.add(0, {"day": 1})
+    emitter.add(0, {"day": 1, "duplicate": True})
+    emitter.add(2, {"day": 3})
+    assert emitted == [{"day": 1}, {"day": 2}, {"day": 3}]
+
+
+def test_day_emitter_partial_json_only_emits_finished_days():
+    emitted = []
+    emitter = ai_planner._DayEmitter(emitted.append)
+    emitter.add_partial('{"destination": "X", "itinerary": [{"day": 1, "theme": "A", "activities": []}, {"day": 2, "th')
+    assert [d["day"] for d in emitted] == [1]
+
+
+def test_plan_segments_shares_days_evenly():
+    assert ai_planner.plan_segments("Paris, France", 3) == [("Paris, France", 3)]
+    assert ai_planner.plan_segments("Paris; Rome ;Barcelona", 7) == [("Paris", 3), ("Rome", 2), ("Barcelona", 2)]
+
+
+def test_generate_trip_renumbers_days_across_destinations(monkeypatch):
+    async def fake_batched(api_key, destination, days, budget, interests, notes, on_day=None):
+        trip = make_trip(destination, days)
+        for daily_plan in trip["itinerary"]:
+            await asyncio.sleep(0.001 * (3 - daily_plan["day"]))
+            if on_day:
+                on_day(daily_plan)
+        return {"status": "success", "data": trip, "usage": {"calls": days}}
+
+    monkeypatch.setattr(ai_planner, "generate_itinerary_batched", fake_batched)
+    streamed = []
+    result = asyncio.run(ai_planner.generate_trip_async("k", "Paris; Rome", 5, "Budget", [], "", streamed.append))
+
+    expected = [(1, "Paris: Theme 1"), (2, "Paris: Theme 2"), (3, "Paris: Theme 3"), (4, "Rome: Theme 1"), (5, "Rome: Theme 2")]
+    assert [(d["day"], d["theme"]) for d in result["data"]["itinerary"]] == expected
+    assert [(d["day"], d["theme"]) for d in streamed] == expected
+    assert result["data"]["budget_tips"] == ["Walk everywhere", "Tip for Paris", "Tip for Rome"]
+    assert result["usage"] == {"calls": 5}
+
+
+def test_generate_trip_needs_a_day_per_destination():
+    result = asyncio.run(ai_planner.generate_trip_async("k", "A; B; C", 2, "Budget", [], ""))
+    assert result["status"] == "error"
+
+
+def test_next_request_round_robins_bins(make_processor):
+    processor = make_processor()
+
+    async def drain():
+        for days in (1, 2, 5, 10, 11):
+            processor._bin_for(ai_planner.ItineraryRequest("k", "X", days, "Budget")).put_nowait((days, None))
+        order = []
+        while (item := processor._next_request()) is not None:
+            order.append(item[0])
+        return order
+
+    order = asyncio.run_coroutine_threadsafe(drain(), processor._loop).result()
+    assert order == [1, 5, 10, 2, 11]
+
+
+def test_failed_request_releases_its_slot(monkeypatch, make_processor):
+    async def flaky_trip(destination, **kwargs):
+        if destination == "fail":
+            raise RuntimeError("boom")
+        return {"status": "success", "data": destination}
+
+    monkeypatch.setattr(ai_planner, "generate_trip_async", flaky_trip)
+    processor = make_processor(max_concurrency=1)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            submit(processor, ai_planner.ItineraryRequest("k", "fail", 1, "Budget"))
+    assert submit(processor, ai_planner.ItineraryRequest("k", "ok", 1, "Budget"))["data"] == "ok"
+
+
+def test_usage_is_reported_per_request(monkeypatch, make_processor, capsys):
+    async def fake_trip(**kwargs):
+        return {"status": "success", "data": {}, "usage": {"calls": 6, "prompt_tokens": 900, "output_tokens": 4000, "cached_tokens": 0}}
+
+    monkeypatch.setattr(ai_planner, "generate_trip_async", fake_trip)
+    submit(make_processor(), ai_planner.ItineraryRequest("k", "Paris", 5, "Budget"))
+    assert "5-day trip to Paris: 6 Gemini calls, 900 prompt tokens (0 cached), 4000 output tokens" in capsys.readouterr().out
+
+
+def test_fan_out_respects_max_concurrency(monkeypatch, make_processor):
+    model = FakeModel()
+
+    async def fake_get_model(api_key, refresh=False):
+        return model
+
+    monkeypatch.setattr(ai_planner, "_get_model", fake_get_model)
+    processor = make_processor(max_concurrency=3, rate_limit_rpm=1000)
+
+    async def submit_all():
+        return await asyncio.gather(*(
+            processor.submit(ai_planner.ItineraryRequest("k", "X", days, "Budget"))
+            for days in (14, 1, 9, 2, 5, 3)
+        ))
+
+    results = asyncio.run(asyncio.wait_for(submit_all(), 10))
+    assert all(result["status"] == "success" for result in results)
+    assert model.peak <= 3
+
+
+def test_small_preamble_is_checked_once_per_key(monkeypatch):
+    threads = []
+
+    async def to_thread(func, *args):
+        threads.append(args)
+        return func(*args)
+
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+    monkeypatch.setattr(ai_planner, "_CACHE", {})
+    monkeypatch.setattr(ai_planner, "_PREAMBLE_TOKENS", 80)
+
+    async def get_models():
+        return [await ai_planner._get_model("k") for _ in range(3)]
+
+    models = asyncio.run(get_models())
+    assert ai_planner._CACHE == {"k": None}
+    assert len(threads) == 1
+    assert models[0] is models[1] is models[2]
@@ -0,0 +1,66 @@
+import orjson
+import pytest
+import zstandard as zstd
+from streamlit.testing.v1 import AppTest
+
+import ai_planner
+
+HOSTILE = "A${alert(1)}`\\"
+
+
+def make_itinerary(name):
+    activity = {"name": name, "time": "Morning", "description": "x", "cost_estimate": name, "latitude": 48.85, "longitude": 2.35}
+    return {
+        "destination": "Paris",
+        "total_estimated_cost": "₹1",
+        "budget_tips": [],
+        "itinerary": [{"day": 1, "theme": "Theme", "activities": [activity]}],
+    }
+
+
+@pytest.fixture
+def app_test(monkeypatch):
+    # Keep the app off Redis and out of the in-process request pool
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:1/0")
+    monkeypatch.setenv("ITINERARY_API_URL", "http://localhost:1")
+    return AppTest.from_file("../app.py", default_timeout=30)
+
+
+def test_map_escapes_model_text(app_test):
+    app_test.session_state["itinerary_data"] = zstd.ZstdCompressor().compress(orjson.dumps(make_itinerary(HOSTILE)))
+    app_test.session_state["error_message"] = None
+    app_test.run()
+
+    assert not app_test.exception
+    map_html = app_test.session_state["map_html"][1]
+    assert "A&#36;{alert(1)}&#96;&#92;" in map_html
+    assert "${alert" not in map_html
+
+
+def test_regenerate_only_clears_its_own_request(app_test, monkeypatch):
+    calls = []
+
+    async def fake_trip(destination, days, on_day=None, **kwargs):
+        calls.append(destination)
+        return {"status": "success", "data": make_itinerary(destination)}
+
+    monkeypatch.setattr(ai_planner, "generate_trip_async", fake_trip)
+    monkeypatch.setenv("GEMINI_API_KEY", "k")
+    monkeypatch.delenv("ITINERARY_API_URL")
+    app_test.run()
+
+    def plan(destination, button=0):
+        app_test.sidebar.text_input[0].input(destination)
+        app_test.sidebar.button[button].click().run()
+        assert not app_test.exception
+
+    plan("Paris")
+    plan("Rome")
+    # Destinations differing only in case share an entry
+    plan(" paris ")
+    assert calls == ["Paris", "Rome"]
+
+    plan("PARIS", button=1)
+    plan("Rome")
+    plan("Paris")
+    assert calls == ["Paris", "Rome", "PARIS"]
@@ -0,0 +1,82 @@
+import json
+import types
+
+import redis
+
+from cache import LayeredCache, RedisSemanticCache, layered, request_key
+
+
+class FakeIndex:
+    def __init__(self, distance):
+        self.distance = distance
+        self.queries = []
+
+    def info(self):
+        return {}
+
+    def search(self, query, query_params):
+        self.queries.append(query.query_string())
+        if self.distance is None:
+            return types.SimpleNamespace(docs=[])
+        doc = types.SimpleNamespace(distance=str(self.distance), payload=json.dumps({"destination": "Paris"}))
+        return types.SimpleNamespace(docs=[doc])
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the cache: a dict for L1, an index for L2."""
+
+    def __init__(self, distance=None, search=True):
+        self.values = {}
+        self.index = FakeIndex(distance)
+        self.search = search
+
+    def ping(self):
+        return True
+
+    def execute_command(self, *args):
+        if not self.search:
+            raise redis.ResponseError(f"unknown command '{args[0]}'")
+        return []
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def set(self, name, value, ex=None):
+        self.values[name] = value
+
+    def ft(self, index_name):
+        return self.index
+
+
+def test_request_key_is_canonical():
+    key = request_key("Paris, France", 3, "Budget", ["Food", "History"], "no early mornings")
+    assert request_key("  paris, france ", 3, "Budget", ["History", "Food"], "no early mornings\n") == key
+    assert request_key("Paris, France", 4, "Budget", ["Food", "History"], "no early mornings") != key
+    assert request_key("Rome", 3, "Budget", ["Food", "History"], "no early mornings") != key
+
+
+def test_semantic_cache_filters_on_destination_days_and_budget():
+    client = FakeRedis(distance=0.0)
+    RedisSemanticCache(client).get(b"vec", "Paris, France", 3, "Ultra-budget")
+    assert client.index.queries[0].startswith("(@destination:{paris_france} @days:[3 3] @budget:{ultra_budget})")
+
+
+def test_semantic_cache_applies_threshold():
+    # RediSearch reports cosine distance, so 0.05 is a similarity of 0.95
+    assert RedisSemanticCache(FakeRedis(distance=0.05), threshold=0.92).get(b"vec", "Paris", 3, "Budget") == {"destination": "Paris"}
+    assert RedisSemanticCache(FakeRedis(distance=0.1), threshold=0.92).get(b"vec", "Paris", 3, "Budget") is None
+    assert RedisSemanticCache(FakeRedis(distance=None)).get(b"vec", "Paris", 3, "Budget") is None
+
+
+def test_missing_search_module_disables_semantic_cache(monkeypatch):
+    embedded = []
+    monkeypatch.setattr(layered, "_embed", embedded.append)
+    monkeypatch.setattr(redis.Redis, "from_url", lambda url: FakeRedis(search=False))
+    cache = LayeredCache.from_url("redis://localhost:6379/0")
+    assert cache.enabled and cache.l2 is None
+
+    trip = dict(destination="Paris", days=3, budget="Budget", interests=["Food"], notes="")
+    assert cache.get("k", **trip) is None
+    cache.set("k", data={"destination": "Paris"}, **trip)
+    assert cache.get("k", **trip) == {"destination": "Paris"}
+    assert embedded == []
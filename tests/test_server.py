@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import ai_planner
+import server
+
+
+def test_itinerary_streams_days_then_result(monkeypatch):
+    async def fake_trip(destination, days, on_day=None, **kwargs):
+        itinerary = []
+        for day in range(1, days + 1):
+            await asyncio.sleep(0.01)
+            itinerary.append({"day": day, "theme": f"Theme {day}", "activities": []})
+            on_day(itinerary[-1])
+        return {"status": "success", "data": {"destination": destination, "itinerary": itinerary}}
+
+    monkeypatch.setattr(ai_planner, "generate_trip_async", fake_trip)
+    monkeypatch.setenv("GEMINI_API_KEY", "k")
+
+    with TestClient(server.app) as client:
+        with client.stream("POST", "/itinerary", json={"destination": "Paris", "days": 2, "budget": "Budget"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/x-ndjson"
+            messages = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert messages[:-1] == [{"day": {"day": 1, "theme": "Theme 1", "activities": []}},
+                             {"day": {"day": 2, "theme": "Theme 2", "activities": []}}]
+    assert messages[-1]["result"]["status"] == "success"
+    assert [d["day"] for d in messages[-1]["result"]["data"]["itinerary"]] == [1, 2]
+    # Leaving the client runs the lifespan shutdown
+    assert server.processor._loop.is_closed()
+
+
+def test_itinerary_rejects_out_of_range_days(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "k")
+    with TestClient(server.app) as client:
+        assert client.post("/itinerary", json={"destination": "Paris", "days": 15, "budget": "Budget"}).status_code == 422